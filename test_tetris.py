@@ -0,0 +1,283 @@
+import itertools
+import pickle
+import random
+
+import numpy
+import pytest
+
+import tetris
+
+
+def test_running_stats_match_numpy():
+    random.seed(0)
+    data = [random.gauss(50, 10) for _ in range(20000)]
+    stats = tetris.RunningStats()
+    for x in data:
+        stats.add(x)
+    assert stats.count == len(data)
+    assert abs(stats.mean - numpy.mean(data)) < 1e-9
+    assert abs(stats.std() - numpy.std(data, ddof=1)) < 1e-9
+    assert stats.min == min(data)
+    assert stats.max == max(data)
+
+
+def test_p2_quantile_continuous_stream():
+    random.seed(1)
+    data = [random.expovariate(0.01) for _ in range(20000)]
+    for p in (0.1, 0.5, 0.9):
+        estimator = tetris.P2Quantile(p)
+        for x in data:
+            estimator.add(x)
+        true_value = numpy.quantile(data, p)
+        assert abs(estimator.value() - true_value) < 0.02 * true_value
+
+
+def test_p2_quantile_discrete_stream_is_approximate():
+    random.seed(2)
+    data = [random.randint(0, 5) for _ in range(20000)]
+    estimator = tetris.P2Quantile(0.5)
+    for x in data:
+        estimator.add(x)
+    # Interpolating between integer values can drift, but never by more than one step
+    assert abs(estimator.value() - numpy.median(data)) <= 1
+    assert 0 <= estimator.value() <= 5
+
+
+def test_p2_quantile_small_sample():
+    estimator = tetris.P2Quantile(0.5)
+    assert estimator.value() == 0.0
+    for x in (7, 1, 4):
+        estimator.add(x)
+    assert estimator.value() == 4.0
+
+
+def test_downsampled_history_stays_bounded_and_evenly_spaced():
+    history = tetris.DownsampledHistory(16)
+    for i in range(10000):
+        history.add((i, -i))
+        assert len(history.points) < history.capacity
+    indices = history.columns()[0]
+    assert indices[0] == 0
+    # Every kept point is a multiple of the stride, with no gaps between them
+    assert all(b - a == history.stride for a, b in zip(indices, indices[1:]))
+    assert indices[-1] > 10000 - 2 * history.stride
+    assert history.columns()[1] == [-i for i in indices]
+
+
+@pytest.mark.parametrize('capacity', [0, 1, 3, 15])
+def test_downsampled_history_rejects_bad_capacity(capacity):
+    with pytest.raises(ValueError):
+        tetris.DownsampledHistory(capacity)
+
+
+# The kernel before compilation, so that its logic is checked whether or not Numba is installed
+RAW_KERNEL = getattr(tetris._kernel_score_moves, 'py_func', tetris._kernel_score_moves)
+
+
+def get_random_board(max_height=tetris.BOARDHEIGHT - 4, fill_chance=0.8):
+    # Create a random board with ragged columns, holes and some complete lines
+    board = tetris.get_blank_board()
+    for x in range(tetris.BOARDWIDTH):
+        height = random.randint(0, max_height)
+        for y in range(tetris.BOARDHEIGHT - height, tetris.BOARDHEIGHT):
+            if random.random() < fill_chance:
+                board[x][y] = random.randint(1, len(tetris.COLORS) - 1)
+    for y in range(tetris.BOARDHEIGHT - max_height, tetris.BOARDHEIGHT):
+        if random.random() < 0.1:
+            for x in range(tetris.BOARDWIDTH):
+                board[x][y] = random.randint(1, len(tetris.COLORS) - 1)
+    return board
+
+
+def score_moves_raw(board, piece, weights):
+    board_array = numpy.array([[int(cell) for cell in column] for column in board], dtype=numpy.int8)
+    rots, sideways, scores = RAW_KERNEL(board_array, tetris.PIECE_ARRAYS[piece['shape']], piece['rotation'],
+                                        piece['x'], piece['y'], piece['color'],
+                                        numpy.asarray(weights, dtype=numpy.float64))
+    return [[int(rot), int(side)] for rot, side in zip(rots, sideways)], scores.tolist()
+
+
+def best_move(move_list, score_list):
+    return move_list[score_list.index(max(score_list))]
+
+
+def check_equivalence(score_function, trials, max_height, fill_chance):
+    for _ in range(trials):
+        board = get_random_board(max_height, fill_chance)
+        piece = tetris.get_new_piece()
+        weights = [-random.uniform(0, 100) for _ in range(4)]
+        move_list, score_list = score_function(board, piece, weights)
+        reference_moves, reference_scores = tetris.score_moves_reference(board, piece, weights)
+        assert move_list == reference_moves
+        assert score_list == reference_scores
+        if move_list:
+            assert best_move(move_list, score_list) == best_move(reference_moves, reference_scores)
+
+
+def test_kernel_logic_matches_reference():
+    random.seed(3)
+    check_equivalence(score_moves_raw, trials=40, max_height=tetris.BOARDHEIGHT - 4, fill_chance=0.8)
+
+
+def test_kernel_logic_matches_reference_on_full_boards():
+    # Nearly full boards leave pieces hanging above the top row
+    random.seed(4)
+    check_equivalence(score_moves_raw, trials=40, max_height=tetris.BOARDHEIGHT, fill_chance=0.95)
+
+
+def test_score_moves_matches_reference():
+    random.seed(5)
+    check_equivalence(tetris.score_moves, trials=100, max_height=tetris.BOARDHEIGHT - 4, fill_chance=0.8)
+
+
+def test_weight_broadcast_round_trip_and_versions():
+    broadcast = tetris.WeightBroadcast(4)
+    try:
+        broadcast.publish([-1, -2, -3, -4], 0.5)
+        assert broadcast.read() == (1, [-1.0, -2.0, -3.0, -4.0], 0.5)
+        broadcast.publish([-5, -6, -7, -8], 0.25)
+        assert broadcast.version() == 2
+        assert broadcast.read() == (2, [-5.0, -6.0, -7.0, -8.0], 0.25)
+    finally:
+        broadcast.close()
+        broadcast.unlink()
+
+
+def test_transition_ring_full_and_empty():
+    ring = tetris.TransitionRing(4)
+    try:
+        assert ring.pop() is None
+        for i in range(4):
+            assert ring.push([i] * tetris.TRANSITION_SIZE)
+        assert not ring.push([4] * tetris.TRANSITION_SIZE)
+        for i in range(4):
+            assert ring.pop() == [float(i)] * tetris.TRANSITION_SIZE
+        assert ring.pop() is None
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_transition_ring_wraps_around():
+    ring = tetris.TransitionRing(3)
+    try:
+        for i in range(10):
+            assert ring.push([i] * tetris.TRANSITION_SIZE)
+            assert ring.push([-i] * tetris.TRANSITION_SIZE)
+            assert ring.pop() == [float(i)] * tetris.TRANSITION_SIZE
+            assert ring.pop() == [float(-i)] * tetris.TRANSITION_SIZE
+        assert ring.pop() is None
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_weight_broadcast_rejects_torn_snapshots():
+    broadcast = tetris.WeightBroadcast(4)
+    try:
+        broadcast.publish([-1, -2, -3, -4], 0.5)
+        # A weight seen before the learner's write of it reached this reader
+        broadcast._values[2] = -9
+        assert broadcast._snapshot() is None
+        broadcast._values[2] = -2
+        assert broadcast._snapshot() == (1, [-1.0, -2.0, -3.0, -4.0], 0.5)
+        # A write still in progress
+        broadcast._words[0] += 1
+        assert broadcast._snapshot() is None
+    finally:
+        broadcast.close()
+        broadcast.unlink()
+
+
+def test_transition_ring_rejects_torn_records():
+    ring = tetris.TransitionRing(2)
+    try:
+        ring.push([1] * tetris.TRANSITION_SIZE)
+        # A payload word seen before the actor's write of it reached the learner
+        ring._records[0, 3] = 7
+        assert ring.pop() is None
+        ring._records[0, 3] = 1
+        assert ring.pop() == [1.0] * tetris.TRANSITION_SIZE
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_transition_ring_rejects_records_from_an_earlier_sequence():
+    ring = tetris.TransitionRing(1)
+    try:
+        ring.push([1] * tetris.TRANSITION_SIZE)
+        assert ring.pop() == [1.0] * tetris.TRANSITION_SIZE
+        # The head count is visible before the record it publishes, so the slot still holds the old record
+        ring._counts[0] += 1
+        assert ring.pop() is None
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_shared_blocks_reattach_by_name_when_pickled():
+    broadcast = tetris.WeightBroadcast(4)
+    ring = tetris.TransitionRing(4)
+    try:
+        copied_broadcast = pickle.loads(pickle.dumps(broadcast))
+        copied_ring = pickle.loads(pickle.dumps(ring))
+        assert copied_broadcast.name == broadcast.name
+        assert copied_ring.name == ring.name
+
+        broadcast.publish([1, 2, 3, 4], 0.1)
+        assert copied_broadcast.read() == (1, [1.0, 2.0, 3.0, 4.0], 0.1)
+        copied_ring.push(list(range(tetris.TRANSITION_SIZE)))
+        assert ring.pop() == [float(i) for i in range(tetris.TRANSITION_SIZE)]
+        copied_broadcast.close()
+        copied_ring.close()
+    finally:
+        broadcast.close()
+        broadcast.unlink()
+        ring.close()
+        ring.unlink()
+
+
+def test_run_learner_needs_an_actor():
+    with pytest.raises(ValueError):
+        tetris.run_learner([-1, -1, -1, -30], 0.5, 1, 0)
+
+
+def failing_actor(broadcast, ring, stop_event, seed, max_pieces, max_seconds):
+    raise RuntimeError('actor failed')
+
+
+def test_run_learner_raises_when_an_actor_dies(monkeypatch):
+    monkeypatch.setattr(tetris, 'run_actor', failing_actor)
+    with pytest.raises(RuntimeError, match='exited with code'):
+        tetris.run_learner([-1, -1, -1, -30], 0.5, 1, 2)
+
+
+ORIGINAL_RUN_ACTOR = tetris.run_actor
+
+
+def half_failing_actor(broadcast, ring, stop_event, seed, max_pieces, max_seconds):
+    # Actors seeded below one half fail straight away, the others keep producing transitions
+    if seed < 0.5:
+        raise RuntimeError('actor failed')
+    ORIGINAL_RUN_ACTOR(broadcast, ring, stop_event, seed, max_pieces, max_seconds)
+
+
+def test_run_learner_notices_a_dead_actor_while_others_produce(monkeypatch):
+    monkeypatch.setattr(tetris, 'run_actor', half_failing_actor)
+    monkeypatch.setattr(tetris.random, 'random', itertools.cycle([0.9, 0.1]).__next__)
+    with pytest.raises(RuntimeError, match='exited with code'):
+        tetris.run_learner([-1, -1, -1, -30], 0.5, 10 ** 6, 2)
+
+
+def test_run_learner_finishes_games():
+    weights, explore_change, score_stats, history = tetris.run_learner([-1, -1, -1, -30], 0.5, 3, 2, max_pieces=20)
+    assert score_stats.count == 3
+    assert history.columns()[0] == [1, 2, 3]
+    assert len(weights) == 4
+
+
+def test_actors_end_games_at_the_time_limit():
+    weights, explore_change, score_stats, history = tetris.run_learner([-1, -1, -1, -30], 0.5, 3, 1, max_seconds=0)
+    assert score_stats.count == 3
+    assert score_stats.max == 0
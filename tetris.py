@@ -13,11 +13,20 @@ import copy
 import numpy
 import matplotlib.pyplot as plt
 import pygame.locals as keys
-import pyautogui
+import multiprocessing
+try:
+    import pyautogui
+except (ImportError, KeyError):  # pyautogui needs a display, which headless training does not have
+    pyautogui = None
+try:
+    import numba  # Optional, compiles the move scoring kernel
+except ImportError:
+    numba = None
 
 # Define settings and constants
-pyautogui.PAUSE = 0.03
-pyautogui.FAILSAFE = True
+if pyautogui is not None:
+    pyautogui.PAUSE = 0.03
+    pyautogui.FAILSAFE = True
 
 FPS = 50
 WINDOWWIDTH = 640
@@ -95,10 +104,24 @@ PIECES = {
     'T': T_SHAPE_TEMPLATE
 }
 
+# Templates as arrays of occupied cells, indexed [rotation][y][x], for the compiled move scoring kernel
+PIECE_ARRAYS = {
+    shape: numpy.array([[[int(cell != BLANK) for cell in row] for row in rotation] for rotation in templates],
+                       dtype=numpy.int8)
+    for shape, templates in PIECES.items()
+}
+
 # Define learning parameters
 alpha = 0.01
 gamma = 0.9
 MAX_GAMES = 75
+MAX_PIECES_PER_GAME = 5000  # Ends runaway games once this many pieces have been played
+MAX_GAME_SECONDS = 1800  # Ends runaway games once they have run for this many seconds
+HISTORY_LENGTH = 1000  # Maximum number of games kept in the plotted score and weight trajectories
+SCORE_QUANTILES = (0.1, 0.5, 0.9)  # Score quantiles tracked across all games
+NUM_ACTORS = 0  # Number of headless rollout worker processes, 0 trains in the pygame window instead
+RING_CAPACITY = 4096  # Number of transitions each actor can queue for the learner
+LEARNER_BATCH = 64  # Maximum number of transitions the learner takes from one actor per pass
 explore_change = 0.5
 weights = [-1, -1, -1, -30]  # Initial weight vector
 
@@ -106,6 +129,9 @@ weights = [-1, -1, -1, -30]  # Initial weight vector
 def run_game(weights, explore_change):
     """Runs a full game of tetris, learning and updating the policy as the game progresses.
 
+    The game ends when a new piece no longer fits on the board, or early once MAX_PIECES_PER_GAME pieces have been
+    played or MAX_GAME_SECONDS have elapsed, so that a strong policy cannot keep a single game running indefinitely.
+
     Arguments:
         weights {list} -- list of four floats, defining the piece placement policy and denoting the respective weighting
                           of the four features:
@@ -134,6 +160,8 @@ def run_game(weights, explore_change):
     score = 0
     one_step_reward = 0
     games_completed = 0
+    pieces_played = 0
+    game_start_time = time.time()
     level, fall_freq = get_level_and_fall_freq(score)
     current_move = [0, 0]  # Relative Rotation, lateral movement
     falling_piece = get_new_piece()
@@ -150,12 +178,13 @@ def run_game(weights, explore_change):
             if not is_valid_position(board, falling_piece):
                 # can't fit a new piece on the board, so game over
                 return score, weights, explore_change
+            pieces_played += 1
+            if pieces_played > MAX_PIECES_PER_GAME or time.time() - game_start_time > MAX_GAME_SECONDS:
+                # the game has run past its piece or time limit, so end it here
+                return score, weights, explore_change
             current_move, weights = gradient_descent(board, falling_piece, weights,
                                                      explore_change)
-            if explore_change > 0.001:
-                explore_change = explore_change * 0.99
-            else:
-                explore_change = 0
+            explore_change = decay_explore_change(explore_change)
         check_for_quit()
         current_move = make_move(current_move)
         for event in pygame.event.get():  # event handling loop
@@ -549,8 +578,8 @@ def simulate_board(test_board, test_piece, move):
     # board, specified by 'move,' an array with two elements, 'rot' and 'sideways'.
     # 'rot' gives the number of times the piece is to be rotated ranging in [0:3]
     # 'sideways' gives the horizontal movement from the piece's current position, in [-9:9]
-    # It removes complete lines and gives returns the next board state as well as the number
-    # of lines cleared.
+    # It removes complete lines and returns the next board state, the one step reward and the
+    # number of lines cleared.
 
     rot = move[0]
     sideways = move[1]
@@ -581,10 +610,37 @@ def simulate_board(test_board, test_piece, move):
 
     height_sum, diff_sum, max_height, holes = get_parameters(test_board)
     one_step_reward = 5 * (test_lines_removed * test_lines_removed) - (height_sum - reference_height)
-    return test_board, one_step_reward
+    return test_board, one_step_reward, test_lines_removed
 
 
 def find_best_move(board, piece, weights, explore_change):
+    move_list, score_list = score_moves(board, piece, weights)
+    best_score = max(score_list)
+    best_move = move_list[score_list.index(best_score)]
+
+    if random.random() < explore_change:
+        move = move_list[random.randint(0, len(move_list) - 1)]
+    else:
+        move = best_move
+    return move
+
+
+def score_moves(board, piece, weights):
+    # This function scores every legal move of the piece on the board in one call, returning
+    # the list of moves and the list of their expected scores. The compiled kernel is used when
+    # Numba is installed, otherwise the pure-Python reference implementation is used.
+    if not USE_COMPILED_KERNEL:
+        return score_moves_reference(board, piece, weights)
+    board_array = numpy.array([[int(cell) for cell in column] for column in board], dtype=numpy.int8)
+    rots, sideways, scores = _kernel_score_moves(board_array, PIECE_ARRAYS[piece['shape']], piece['rotation'],
+                                                 piece['x'], piece['y'], piece['color'],
+                                                 numpy.asarray(weights, dtype=numpy.float64))
+    move_list = [[int(rot), int(side)] for rot, side in zip(rots, sideways)]
+    return move_list, scores.tolist()
+
+
+def score_moves_reference(board, piece, weights):
+    # Pure-Python reference for score_moves, built on simulate_board and get_expected_score.
     move_list = []
     score_list = []
     for rot in range(0, len(PIECES[piece['shape']])):
@@ -597,14 +653,121 @@ def find_best_move(board, piece, weights, explore_change):
                 move_list.append(move)
                 test_score = get_expected_score(test_board[0], weights)
                 score_list.append(test_score)
-    best_score = max(score_list)
-    best_move = move_list[score_list.index(best_score)]
+    return move_list, score_list
 
-    if random.random() < explore_change:
-        move = move_list[random.randint(0, len(move_list) - 1)]
-    else:
-        move = best_move
-    return move
+
+# The kernel functions below mirror is_valid_position, add_to_board, remove_complete_lines,
+# get_parameters and simulate_board, but work on a (BOARDWIDTH, BOARDHEIGHT) integer array
+# with 0 for blank cells so that they can be compiled by Numba.
+
+def _kernel_is_valid_position(board, template, piece_x, piece_y):
+    for x in range(TEMPLATEWIDTH):
+        for y in range(TEMPLATEHEIGHT):
+            if y + piece_y < 0 or template[y, x] == 0:
+                continue
+            board_x = x + piece_x
+            board_y = y + piece_y
+            if board_x < 0 or board_x >= BOARDWIDTH or board_y >= BOARDHEIGHT:
+                return False  # The piece is off the board
+            if board[board_x, board_y] != 0:
+                return False  # The piece collides
+    return True
+
+
+def _kernel_add_to_board(board, template, piece_x, piece_y, color):
+    for x in range(TEMPLATEWIDTH):
+        for y in range(TEMPLATEHEIGHT):
+            if template[y, x] != 0 and x + piece_x < BOARDWIDTH and y + piece_y < BOARDHEIGHT:
+                board_y = y + piece_y
+                if board_y < 0:
+                    board_y += BOARDHEIGHT  # Wrap around like the list indexing in add_to_board
+                board[x + piece_x, board_y] = color
+
+
+def _kernel_remove_complete_lines(board):
+    lines_removed = 0
+    y = BOARDHEIGHT - 1
+    while y >= 0:
+        complete = True
+        for x in range(BOARDWIDTH):
+            if board[x, y] == 0:
+                complete = False
+                break
+        if complete:
+            for pull_down_y in range(y, 0, -1):
+                for x in range(BOARDWIDTH):
+                    board[x, pull_down_y] = board[x, pull_down_y - 1]
+            for x in range(BOARDWIDTH):
+                board[x, 0] = 0
+            lines_removed += 1
+        else:
+            y -= 1
+    return lines_removed
+
+
+def _kernel_get_parameters(board):
+    height_sum = 0
+    diff_sum = 0
+    max_height = 0
+    holes = 0
+    previous_height = 0
+    for i in range(BOARDWIDTH):
+        height = 0
+        occupied = False
+        for j in range(BOARDHEIGHT):
+            if board[i, j] > 0:
+                if not occupied:
+                    height = BOARDHEIGHT - j
+                    occupied = True
+            elif occupied:
+                holes += 1
+        height_sum += height
+        max_height = max(max_height, height)
+        if i > 0:
+            diff_sum += abs(height - previous_height)
+        previous_height = height
+    return height_sum, diff_sum, max_height, holes
+
+
+def _kernel_score_moves(board, templates, rotation, piece_x, piece_y, color, weights):
+    num_rotations = templates.shape[0]
+    rots = numpy.empty(num_rotations * 11, dtype=numpy.int64)
+    sideways_moves = numpy.empty(num_rotations * 11, dtype=numpy.int64)
+    scores = numpy.empty(num_rotations * 11, dtype=numpy.float64)
+    count = 0
+    for rot in range(num_rotations):
+        template = templates[(rotation + rot) % num_rotations]
+        for sideways in range(-5, 6):
+            x = piece_x + sideways
+            if not _kernel_is_valid_position(board, template, x, piece_y):
+                continue
+
+            # Drop the piece exactly as simulate_board does
+            y = piece_y
+            for i in range(BOARDHEIGHT):
+                if _kernel_is_valid_position(board, template, x, y + 1):
+                    y = i
+
+            test_board = board.copy()
+            if _kernel_is_valid_position(test_board, template, x, y):
+                _kernel_add_to_board(test_board, template, x, y, color)
+                _kernel_remove_complete_lines(test_board)
+            height_sum, diff_sum, max_height, holes = _kernel_get_parameters(test_board)
+            rots[count] = rot
+            sideways_moves[count] = sideways
+            scores[count] = weights[0] * height_sum + weights[1] * diff_sum + weights[2] * max_height + \
+                weights[3] * holes
+            count += 1
+    return rots[:count], sideways_moves[:count], scores[:count]
+
+
+USE_COMPILED_KERNEL = numba is not None
+if USE_COMPILED_KERNEL:
+    _kernel_is_valid_position = numba.njit(cache=True)(_kernel_is_valid_position)
+    _kernel_add_to_board = numba.njit(cache=True)(_kernel_add_to_board)
+    _kernel_remove_complete_lines = numba.njit(cache=True)(_kernel_remove_complete_lines)
+    _kernel_get_parameters = numba.njit(cache=True)(_kernel_get_parameters)
+    _kernel_score_moves = numba.njit(cache=True)(_kernel_score_moves)
 
 
 def make_move(move):
@@ -638,6 +801,13 @@ def gradient_descent(board, piece, weights, explore_change):
     if test_board is not None:
         new_params = get_parameters(test_board[0])
         one_step_reward = test_board[1]
+    weights = update_weights(weights, old_params, new_params, one_step_reward)
+    return move, weights
+
+
+def update_weights(weights, old_params, new_params, one_step_reward):
+    # This function applies one learning step to the weights, given the board parameters
+    # before and after a move and the reward that move earned.
     for i in range(0, len(weights)):
         weights[i] = weights[i] + alpha * weights[i] * (
             one_step_reward - old_params[i] + gamma * new_params[i])
@@ -645,10 +815,503 @@ def gradient_descent(board, piece, weights, explore_change):
     for i in range(0, len(weights)):
         weights[i] = 100 * weights[i] / regularization_term
         weights[i] = math.floor(1e4 * weights[i]) / 1e4  # Rounds the weights
-    return move, weights
+    return weights
+
+
+def decay_explore_change(explore_change):
+    # Reduce the exploration probability after each piece, switching it off once it is small.
+    if explore_change > 0.001:
+        return explore_change * 0.99
+    return 0
+
+
+class P2Quantile(object):
+    """Streaming estimate of a single quantile using the P-squared algorithm of Jain and Chlamtac.
+
+    Only five markers are stored, so memory use stays constant no matter how many values are added. The result is an
+    approximation: the markers are interpolated between observed values, so on streams of small integers, such as
+    early game scores, the estimate can land up to one whole step away from the true quantile.
+
+    Arguments:
+        p {float} -- The quantile to estimate, between 0 and 1.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        n = self.positions
+        if len(q) < 5:
+            # Collect the first five observations to initialize the markers
+            q.append(x)
+            q.sort()
+            return
+
+        # Find the cell containing x, extending the extreme markers if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(0, 5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = self._linear(i, d)
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def _linear(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+    def value(self):
+        if not self.heights:
+            return 0.0
+        if len(self.heights) < 5:
+            # Too few observations for the markers, so read the quantile from the sorted sample
+            return float(self.heights[int(round(self.p * (len(self.heights) - 1)))])
+        return float(self.heights[2])
+
+
+class RunningStats(object):
+    """Constant-space summary of a stream of values: count, mean, variance, extremes and quantiles.
+
+    Arguments:
+        quantiles {tuple} -- The quantiles to estimate, each between 0 and 1.
+    """
+
+    def __init__(self, quantiles=SCORE_QUANTILES):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0
+        self._quantiles = dict((p, P2Quantile(p)) for p in quantiles)
+
+    def add(self, x):
+        # Welford's online update of the mean and the sum of squared deviations
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        for estimator in self._quantiles.values():
+            estimator.add(x)
+
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def quantile(self, p):
+        return self._quantiles[p].value()
+
+
+class DownsampledHistory(object):
+    """Fixed-size record of a long trajectory, keeping every stride-th point.
+
+    Whenever the buffer fills up, every other point is dropped and the stride doubles, so the kept points stay evenly
+    spaced over the whole run while memory use stays bounded by the capacity.
+
+    Arguments:
+        capacity {int} -- The maximum number of points to keep. Must be even and at least 2.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 2 or capacity % 2:
+            raise ValueError('DownsampledHistory capacity must be even and at least 2, got %d' % capacity)
+        self.capacity = capacity
+        self.stride = 1
+        self.points = []
+        self._seen = 0
+
+    def add(self, point):
+        if self._seen % self.stride == 0:
+            self.points.append(point)
+            if len(self.points) >= self.capacity:
+                self.points = self.points[::2]
+                self.stride *= 2
+        self._seen += 1
+
+    def columns(self):
+        # Transpose the kept points into one list per field, ready for plotting
+        return [list(column) for column in zip(*self.points)]
+
+
+# Layout of a transition record sent from an actor to the learner:
+# [kind, reward or final score, four board parameters before the move, four board parameters after the move]
+TRANSITION_SIZE = 10
+TRANSITION_MOVE = 0
+TRANSITION_GAME_OVER = 1
+
+
+def _check_word(words, sequence):
+    # Hash the raw 64-bit words of a shared record together with its sequence number. Writers store this check
+    # word after the payload, and readers only accept a record whose check word matches, which rejects records
+    # caught half-written or left over from an earlier sequence number.
+    mask = (1 << 64) - 1
+    check = (sequence * 0x9E3779B97F4A7C15) & mask
+    for word in words:
+        check = ((check ^ (word & mask)) * 0x100000001B3) & mask
+    return check - (1 << 64) if check >= (1 << 63) else check  # As a signed value that fits in an int64
+
+
+def _words_to_floats(words):
+    return numpy.array(words, dtype=numpy.int64).view(numpy.float64).tolist()
+
+
+class WeightBroadcast(object):
+    """Shared-memory block through which the learner publishes the weights and explore_change to the actors.
+
+    The block holds a version counter followed by explore_change and the weights. The counter is used as a seqlock:
+    the learner makes it odd while writing and even again when done, so an actor can check for a new version with a
+    single read between pieces, and only copies the values out when the version has changed.
+
+    Plain numpy stores give no memory barriers, so on weakly ordered CPUs such as ARM an actor may see the stores out
+    of order. The learner therefore also writes a check word, hashed from the values and the version, after the values.
+    A snapshot is only accepted when its check word matches, so a torn snapshot is retried instead of being used.
+
+    Arguments:
+        num_weights {int} -- The number of weights in the policy.
+        name {str} -- The name of an existing block to attach to. If None, a new block is created.
+    """
+
+    def __init__(self, num_weights=4, name=None):
+        self.num_weights = num_weights
+        from multiprocessing import shared_memory  # Needs Python 3.8 or newer
+        size = 8 * (3 + num_weights)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._attach()
+
+    def _attach(self):
+        # Counter, explore_change, weights and check word, viewed as raw words and as the floating point values
+        self._words = numpy.ndarray((3 + self.num_weights,), dtype=numpy.int64, buffer=self.shm.buf, offset=0)
+        self._values = numpy.ndarray((1 + self.num_weights,), dtype=numpy.float64, buffer=self.shm.buf, offset=8)
+
+    def __getstate__(self):
+        # Send only the block name to child processes, which attach to the same memory
+        return {'num_weights': self.num_weights, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['num_weights'], state['name'])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def version(self):
+        return int(self._words[0]) // 2
+
+    def publish(self, weights, explore_change):
+        counter = int(self._words[0]) + 1
+        self._words[0] = counter  # Odd while the values are being written
+        self._values[0] = explore_change
+        self._values[1:] = weights
+        self._words[-1] = _check_word(self._words[1:-1].tolist(), counter + 1)
+        self._words[0] = counter + 1
+
+    def read(self):
+        # Returns the version, weights and explore_change from a consistent snapshot of the block
+        while True:
+            snapshot = self._snapshot()
+            if snapshot is not None:
+                return snapshot
+
+    def _snapshot(self):
+        # Returns None if the copy caught the learner mid-write or saw its stores out of order
+        words = self._words.tolist()
+        counter = words[0]
+        if counter % 2 or words[-1] != _check_word(words[1:-1], counter):
+            return None
+        values = _words_to_floats(words[1:-1])
+        return counter // 2, values[1:], values[0]
+
+    def close(self):
+        del self._words, self._values
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class TransitionRing(object):
+    """Lock-free ring buffer in shared memory, carrying transitions from one actor to the learner.
+
+    Each ring has exactly one producer (an actor) and one consumer (the learner). The producer only ever advances the
+    head count and the consumer only ever advances the tail count, so no lock is needed.
+
+    Plain numpy stores give no memory barriers, so on weakly ordered CPUs such as ARM the learner may see the head
+    count before the record it publishes. Each record therefore ends with a check word, hashed from the payload and
+    its sequence number. pop treats a record whose check word does not match as not yet written, and tries it again
+    on a later call.
+
+    Arguments:
+        capacity {int} -- The number of records the ring can hold.
+        name {str} -- The name of an existing ring to attach to. If None, a new ring is created.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, name=None):
+        self.capacity = capacity
+        from multiprocessing import shared_memory  # Needs Python 3.8 or newer
+        size = 8 * (2 + capacity * (TRANSITION_SIZE + 1))
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._attach()
+        if name is None:
+            self._counts[:] = 0
+
+    def _attach(self):
+        self._counts = numpy.ndarray((2,), dtype=numpy.int64, buffer=self.shm.buf, offset=0)  # Head, tail
+        # Each record is the payload followed by its check word, viewed as raw words and as floating point values
+        self._words = numpy.ndarray((self.capacity, TRANSITION_SIZE + 1), dtype=numpy.int64, buffer=self.shm.buf,
+                                    offset=16)
+        self._records = numpy.ndarray((self.capacity, TRANSITION_SIZE + 1), dtype=numpy.float64, buffer=self.shm.buf,
+                                      offset=16)
+
+    def __getstate__(self):
+        # Send only the ring name to child processes, which attach to the same memory
+        return {'capacity': self.capacity, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['capacity'], state['name'])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def push(self, record):
+        # Returns False without writing if the ring is full
+        head = int(self._counts[0])
+        if head - int(self._counts[1]) >= self.capacity:
+            return False
+        slot = head % self.capacity
+        self._records[slot, :TRANSITION_SIZE] = record
+        self._words[slot, TRANSITION_SIZE] = _check_word(self._words[slot, :TRANSITION_SIZE].tolist(), head + 1)
+        self._counts[0] = head + 1
+        return True
+
+    def pop(self):
+        # Returns the oldest record as a list, or None if the ring is empty or the record is not fully visible yet
+        tail = int(self._counts[1])
+        if tail == int(self._counts[0]):
+            return None
+        words = self._words[tail % self.capacity].tolist()
+        if words[-1] != _check_word(words[:-1], tail + 1):
+            return None
+        self._counts[1] = tail + 1
+        return _words_to_floats(words[:-1])
+
+    def close(self):
+        del self._counts, self._words, self._records
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def run_actor(broadcast, ring, stop_event, seed, max_pieces, max_seconds):
+    """Plays headless games with the latest published policy, sending every transition to the learner.
+
+    Arguments:
+        broadcast {WeightBroadcast} -- The block the learner publishes the weights and explore_change into.
+        ring {TransitionRing} -- The ring this actor sends its transitions through.
+        stop_event {multiprocessing.Event} -- Set by the learner when the actor should exit.
+        seed {int} -- Seed for the random piece sequence and exploration of this actor.
+        max_pieces {int} -- The number of pieces after which a game is ended early.
+        max_seconds {float} -- The number of seconds after which a game is ended early.
+    """
+    random.seed(seed)
+    version, weights, explore_change = broadcast.read()
+    while not stop_event.is_set():
+        board = get_blank_board()
+        score = 0
+        pieces_played = 0
+        game_start_time = time.time()
+        while not stop_event.is_set():
+            if broadcast.version() != version:
+                # Pick up the new policy between pieces
+                version, weights, explore_change = broadcast.read()
+            piece = get_new_piece()
+            if not is_valid_position(board, piece):
+                break  # Game over
+            if pieces_played >= max_pieces or time.time() - game_start_time > max_seconds:
+                break  # The game has run past its piece or time limit, so end it here
+            move = find_best_move(board, piece, weights, explore_change)
+            old_params = get_parameters(board)
+            board, one_step_reward, lines = simulate_board(board, piece, move)
+            score += lines * lines
+            pieces_played += 1
+            send_record(ring, [TRANSITION_MOVE, one_step_reward] + list(old_params) + list(get_parameters(board)),
+                        stop_event)
+        send_record(ring, [TRANSITION_GAME_OVER, score] + [0] * (TRANSITION_SIZE - 2), stop_event)
+    broadcast.close()
+    ring.close()
+
+
+def send_record(ring, record, stop_event):
+    # Wait for the learner to make room in the ring, unless the actor is being stopped.
+    while not ring.push(record):
+        if stop_event.is_set():
+            return
+        time.sleep(0.001)
+
+
+def run_learner(weights, explore_change, max_games, num_actors, max_pieces=MAX_PIECES_PER_GAME,
+                max_seconds=MAX_GAME_SECONDS):
+    """Trains the policy from transitions played by headless actor processes.
+
+    The learner owns the weights and explore_change. After every transition it updates them and publishes the new
+    version into shared memory, where the actors pick it up between pieces.
+
+    Arguments:
+        weights {list} -- The initial weights of the policy.
+        explore_change {float} -- The initial probability of making a random move.
+        max_games {int} -- The number of finished games after which training stops.
+        num_actors {int} -- The number of actor processes to play games. Must be at least 1.
+        max_pieces {int} -- The number of pieces after which an actor ends a game early.
+        max_seconds {float} -- The number of seconds after which an actor ends a game early.
+
+    Returns:
+        weights {list} -- The learned weights.
+        explore_change {float} -- The decayed exploration probability.
+        score_stats {RunningStats} -- Summary of the scores of all finished games.
+        history {DownsampledHistory} -- Downsampled game index, score and weight trajectories.
+    """
+    if num_actors < 1:
+        raise ValueError('run_learner needs at least one actor, got %d' % num_actors)
+    score_stats = RunningStats()
+    history = DownsampledHistory(HISTORY_LENGTH)
+    games_completed = 0
+    broadcast = WeightBroadcast(len(weights))
+    broadcast.publish(weights, explore_change)
+    rings = [TransitionRing(RING_CAPACITY) for _ in range(num_actors)]
+    stop_event = multiprocessing.Event()
+    actors = [
+        multiprocessing.Process(target=run_actor,
+                                args=(broadcast, ring, stop_event, random.random(), max_pieces, max_seconds))
+        for ring in rings
+    ]
+    for actor in actors:
+        actor.start()
+    try:
+        while games_completed < max_games:
+            for actor in actors:
+                if actor.exitcode is not None:
+                    # Actors only exit once stopped, so a finished actor has failed
+                    raise RuntimeError('Actor process %d exited with code %d' % (actor.pid, actor.exitcode))
+            idle = True
+            for ring in rings:
+                # Take a bounded batch from each ring in turn so that one fast actor cannot starve the others
+                for _ in range(LEARNER_BATCH):
+                    if games_completed >= max_games:
+                        break
+                    record = ring.pop()
+                    if record is None:
+                        break
+                    idle = False
+                    if record[0] == TRANSITION_MOVE:
+                        one_step_reward = record[1]
+                        old_params = record[2:6]
+                        new_params = record[6:10]
+                        weights = update_weights(weights, old_params, new_params, one_step_reward)
+                        explore_change = decay_explore_change(explore_change)
+                        broadcast.publish(weights, explore_change)
+                    else:
+                        games_completed += 1
+                        print("Game Number ", games_completed, " achieved a score of: ", int(record[1]))
+                        score_stats.add(int(record[1]))
+                        history.add((games_completed, int(record[1]), -weights[0], -weights[1], -weights[2],
+                                     -weights[3]))
+            if idle:
+                time.sleep(0.001)
+    finally:
+        stop_event.set()
+        for actor in actors:
+            actor.join()
+        for shared in [broadcast] + rings:
+            shared.close()
+            shared.unlink()
+    return weights, explore_change, score_stats, history
+
+
+def plot_learning_curves(score_stats, history, games_completed):
+    # Print the score summary, then plot the game score and the weights over time
+    print("Score mean: %.2f, standard deviation: %.2f, range: %s to %s" %
+          (score_stats.mean, score_stats.std(), score_stats.min, score_stats.max))
+    for p in SCORE_QUANTILES:
+        print("Score %d%% quantile (approximate): %.2f" % (100 * p, score_stats.quantile(p)))
+    game_index_array, scoreArray, weight0Array, weight1Array, weight2Array, weight3Array = history.columns()
+
+    # Plot the game score over time
+    plt.figure(1)
+    plt.subplot(211)
+    plt.plot(game_index_array, scoreArray, 'k-')
+    plt.xlabel('Game Number')
+    plt.ylabel('Game Score')
+    plt.title('Learning Curve')
+    plt.xlim(1, games_completed)
+    plt.ylim(0, score_stats.max * 1.1)
+
+    # Plot the weights over time
+    plt.subplot(212)
+    plt.xlabel('Game Number')
+    plt.ylabel('Weights')
+    plt.title('Learning Curve')
+    ax = plt.gca()
+    ax.set_yscale('log')
+    plt.plot(game_index_array, weight0Array, label="Aggregate Height")
+    plt.plot(game_index_array, weight1Array, label="Unevenness")
+    plt.plot(game_index_array, weight2Array, label="Maximum Height")
+    plt.plot(game_index_array, weight3Array, label="Number of Holes")
+    plt.legend(loc='lower left')
+    plt.xlim(0, games_completed)
+    plt.ylim(0.0001, 100)
+    plt.show()
 
 
 if __name__ == '__main__':
+    if NUM_ACTORS > 0:
+        # Train headlessly with rollout worker processes
+        weights, explore_change, score_stats, history = run_learner(weights, explore_change, MAX_GAMES, NUM_ACTORS)
+        plot_learning_curves(score_stats, history, score_stats.count)
+        sys.exit()
+
     global FPSCLOCK, DISPLAYSURF, BASICFONT, BIGFONT
     pygame.init()
     FPSCLOCK = pygame.time.Clock()
@@ -659,48 +1322,16 @@ if __name__ == '__main__':
 
     show_text_screen('Tetromino')
     games_completed = 0
-    scoreArray = []
-    weight0Array = []
-    weight1Array = []
-    weight2Array = []
-    weight3Array = []
-    game_index_array = []
+    score_stats = RunningStats()
+    history = DownsampledHistory(HISTORY_LENGTH)
     time.sleep(5)
     while True:  # game loop
         games_completed += 1
         newScore, weights, explore_change = run_game(weights, explore_change)
         print("Game Number ", games_completed, " achieved a score of: ", newScore)
-        scoreArray.append(newScore)
-        game_index_array.append(games_completed)
-        weight0Array.append(-weights[0])
-        weight1Array.append(-weights[1])
-        weight2Array.append(-weights[2])
-        weight3Array.append(-weights[3])
+        score_stats.add(newScore)
+        history.add((games_completed, newScore, -weights[0], -weights[1], -weights[2], -weights[3]))
         show_text_screen('Game Over')
         if games_completed >= MAX_GAMES:
-            # Plot the game score over time
-            plt.figure(1)
-            plt.subplot(211)
-            plt.plot(game_index_array, scoreArray, 'k-')
-            plt.xlabel('Game Number')
-            plt.ylabel('Game Score')
-            plt.title('Learning Curve')
-            plt.xlim(1, max(game_index_array))
-            plt.ylim(0, max(scoreArray) * 1.1)
-
-            # Plot the weights over time
-            plt.subplot(212)
-            plt.xlabel('Game Number')
-            plt.ylabel('Weights')
-            plt.title('Learning Curve')
-            ax = plt.gca()
-            ax.set_yscale('log')
-            plt.plot(game_index_array, weight0Array, label="Aggregate Height")
-            plt.plot(game_index_array, weight1Array, label="Unevenness")
-            plt.plot(game_index_array, weight2Array, label="Maximum Height")
-            plt.plot(game_index_array, weight3Array, label="Number of Holes")
-            plt.legend(loc='lower left')
-            plt.xlim(0, max(game_index_array))
-            plt.ylim(0.0001, 100)
-            plt.show()
+            plot_learning_curves(score_stats, history, games_completed)
             break